@@ -1,10 +1,28 @@
-import requests
-import json
+import asyncio
+import httpx
+import orjson
 import os
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from functools import cached_property
+from typing import Optional, Dict, Tuple
 import re
-import threading
+import ssl
+import time
+import calendar
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Antecedência (em segundos) com que o token é renovado antes de expirar
+MARGEM_RENOVACAO_SEGUNDOS = 10 * 60
+
+# Remove protocolo, porta e path de uma URL, deixando apenas o domínio
+_DOMAIN_RE = re.compile(r'^https?://|:\d+.*|/.*$')
+
+# Contexto TLS sem verificação de certificado, criado uma única vez e compartilhado por todos os clientes
+_CONTEXTO_SSL = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+_CONTEXTO_SSL.check_hostname = False
+_CONTEXTO_SSL.verify_mode = ssl.CERT_NONE
 
 class GerenciadorToken:
     """
@@ -33,37 +51,62 @@ class GerenciadorToken:
             os.makedirs(pasta_tokens)
 
         if arquivo_cookies is None:
-            # remover tudo além do domínio para criar nome do arquivo
-            url_login_limpo = re.sub(r'^https?://', '', dominio)  # remove protocolo
-            url_login_limpo = re.sub(r':\d+', '', url_login_limpo)  # remove porta
-            url_login_limpo = re.sub(r'/.*$', '', url_login_limpo)  # remove path
-            arquivo_cookies = os.path.join(pasta_tokens, url_login_limpo + '_' + 'cookies.json')
-
-
-
+            # o domínio já está sem protocolo, porta e path
+            arquivo_cookies = os.path.join(pasta_tokens, dominio + '_' + 'cookies.json')
 
-        self.url_login = f"https://{dominio}/Login"
-        self.cadastros_estruturais_url = f"https://{dominio}:8343/CadastrosEstruturaisAPI/api/v1/:entidade"
-        self.api_sql_url = f"https://{dominio}:8343/ConstrutorAnaliseAPI/api/Analysis/GetSqlResult"
-        self.cadastros_estruturais_ativar_categoria = f'https://{dominio}:8343/CadastrosEstruturaisAPI/api/v1/Familia/:codigo_categoria/ativar-categoria'
-        self.informacoes_nutricionais_url = f"https://{dominio}:8343/CadastrosEstruturaisAPI/api/v1/Familia/informacao-nutricional"
-
-
-        # self.url_login = url_login
+        # As URLs dos endpoints são montadas sob demanda a partir do domínio (ver propriedades abaixo)
+        self._dominio = dominio
         self.nome = nome
         self.senha = senha
         self.nro_empresa = nro_empresa
         self.arquivo_cookies = arquivo_cookies
-        self.session = requests.Session()
+        # Cliente assíncrono compartilhado para o login e as chamadas às APIs (pool de conexões e cookies).
+        # Cada instância mantém seu próprio pool, já que cada ambiente aponta para um host diferente.
+        self.client = httpx.AsyncClient(
+            verify=_CONTEXTO_SSL,
+            http2=True,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=30.0),
+            timeout=httpx.Timeout(connect=5.0, read=60.0, write=10.0, pool=5.0)
+        )
         self._token_data: Optional[Dict] = None
-        self._validade_token: Optional[datetime] = None
-        self._lock = threading.Lock()  # Mutex para garantir thread-safety
-        self._query_lock = threading.Lock()  # Mutex para serializar consultas SQL
+        self._validade_token: Optional[datetime] = None  # Usado apenas para exibição em status_token
+        self._expires_at: float = 0.0  # Instante (Unix, UTC) a partir do qual o token deve ser renovado
+        self._expires_at_mono: float = 0.0  # O mesmo instante em time.monotonic(), usado no fast path
+        self._auth_header: Optional[str] = None  # Cabeçalho 'Bearer ...' do token atual
+        self._cookies_mtime: float = 0.0  # mtime do arquivo de cookies quando o token em memória foi lido/gravado
+        self._lock = asyncio.Lock()  # Garante que apenas uma corrotina renove o token
+
+    async def aclose(self) -> None:
+        """
+        Fecha o cliente HTTP assíncrono e libera as conexões do pool.
+        """
+        await self.client.aclose()
+
+    @cached_property
+    def url_login(self) -> str:
+        # sempre https no domínio extraído, independente do protocolo/porta/path informados
+        return f"https://{self._dominio}/Login"
+
+    @cached_property
+    def cadastros_estruturais_url(self) -> str:
+        return f"https://{self._dominio}:8343/CadastrosEstruturaisAPI/api/v1/:entidade"
 
-    def consulta_sql(self, sql_text: str) -> Optional[Dict]:
+    @cached_property
+    def api_sql_url(self) -> str:
+        return f"https://{self._dominio}:8343/ConstrutorAnaliseAPI/api/Analysis/GetSqlResult"
+
+    @cached_property
+    def cadastros_estruturais_ativar_categoria(self) -> str:
+        return f'https://{self._dominio}:8343/CadastrosEstruturaisAPI/api/v1/Familia/:codigo_categoria/ativar-categoria'
+
+    @cached_property
+    def informacoes_nutricionais_url(self) -> str:
+        return f"https://{self._dominio}:8343/CadastrosEstruturaisAPI/api/v1/Familia/informacao-nutricional"
+
+    async def consulta_sql(self, sql_text: str) -> Optional[Dict]:
         """
         Consulta SQL usando a API autenticada.
-        Thread-safe: apenas uma consulta é executada por vez, as demais aguardam em fila.
+        Várias consultas podem ser executadas simultaneamente sobre o mesmo cliente.
 
         Args:
             sql: Comando SQL a ser executado
@@ -71,47 +114,53 @@ class GerenciadorToken:
         Returns:
             Dict: Resultado da consulta SQL se bem-sucedido, None caso contrário
         """
-        # Lock para garantir que apenas uma consulta seja executada por vez
-        with self._query_lock:
-            print(f'Executando consulta SQL (thread: {threading.current_thread().name})...')
+        conteudo = await self.consulta_sql_bruta(sql_text)
+        if conteudo is None:
+            return None
+        return orjson.loads(conteudo)
 
-            session = self.obter_session_autenticada()
+    async def consulta_sql_bruta(self, sql_text: str) -> Optional[bytes]:
+        """
+        Consulta SQL usando a API autenticada, sem decodificar a resposta.
+        Útil para repassar o JSON da API diretamente ao cliente.
 
-            body2 = """
-            {
-                "CommandText": "{SQL_TEXT}",
-                "ConnectionType": 0,
-                "Limit": null
-            }
-            """
+        Args:
+            sql: Comando SQL a ser executado
 
-            ss = requests.Session()
+        Returns:
+            bytes: Corpo JSON da resposta se bem-sucedido, None caso contrário
+        """
+        logger.debug('Executando consulta SQL...')
 
-            headers = {
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-                "Authorization": f"Bearer {self.pegar_token_atualizado()['access_token']}"
-            }
+        client, auth_header = await self._session_and_token()
+        if client is None:
+            logger.warning('Sessão não autenticada. Não é possível executar a consulta SQL.')
+            return None
 
-            dados_objetos = ss.post(self.api_sql_url, data=body2.replace("{SQL_TEXT}", sql_text), headers=headers, verify=False)
+        headers = {
+            "Accept": "application/json",
+            "Authorization": auth_header
+        }
 
-            if dados_objetos.status_code == 200:
-                print(f'Consulta SQL concluída com sucesso (thread: {threading.current_thread().name})')
-                return dados_objetos.json()
-            else:
-                print(f'Erro na consulta SQL: {dados_objetos.status_code}')
-                return None
+        dados_objetos = await client.post(
+            self.api_sql_url,
+            json={"CommandText": sql_text, "ConnectionType": 0, "Limit": None},
+            headers=headers
+        )
+
+        if dados_objetos.status_code == 200:
+            logger.debug('Consulta SQL concluída com sucesso')
+            return dados_objetos.content
+        else:
+            logger.warning('Erro na consulta SQL: %s', dados_objetos.status_code)
+            return None
 
     def extrair_dominio(self, url: str) -> str:
         # remover protocolo, porta e path do url
-        url = re.sub(r'^https?://', '', url)  # remove protocolo
-        url = re.sub(r':\d+', '', url)  # remove porta
-        url = re.sub(r'/.*$', '', url)  # remove path
+        return _DOMAIN_RE.sub('', url)
 
-        return url
 
-
-    def _fazer_login(self) -> bool:
+    async def _fazer_login(self) -> bool:
         """
         Realiza o login e obtém um novo token.
 
@@ -129,35 +178,36 @@ class GerenciadorToken:
                 'NroEmpresa': self.nro_empresa,
             }
 
-            response = self.session.post(self.url_login, data=modelo_request, verify=False)
+            response = await self.client.post(self.url_login, data=modelo_request, follow_redirects=True)
 
             if response.status_code == 200:
                 # Salvar cookies
-                cookies_dict = {cookie.name: cookie.value for cookie in self.session.cookies}
-                with open(self.arquivo_cookies, 'w', encoding='utf-8') as f:
-                    json.dump(cookies_dict, f, ensure_ascii=False, indent=4)
+                cookies_dict = {cookie.name: cookie.value for cookie in self.client.cookies.jar}
+                with open(self.arquivo_cookies, 'wb') as f:
+                    f.write(orjson.dumps(cookies_dict))
+                self._cookies_mtime = os.path.getmtime(self.arquivo_cookies)
 
                 # Extrair dados do token
                 if 'oAuthToken' in cookies_dict:
-                    self._token_data = json.loads(cookies_dict['oAuthToken'])
+                    self._token_data = orjson.loads(cookies_dict['oAuthToken'])
+                    self._auth_header = f"Bearer {self._token_data['access_token']}"
                     # Converter data de validade
-                    self._validade_token = datetime.strptime(
-                        self._token_data['.expires'],
-                        '%Y-%m-%dT%H:%M:%SZ'
-                    )
+                    self._validade_token = datetime.fromisoformat(self._token_data['.expires'].rstrip('Z'))
+                    self._expires_at = calendar.timegm(self._validade_token.utctimetuple()) - MARGEM_RENOVACAO_SEGUNDOS
+                    self._expires_at_mono = time.monotonic() + (self._expires_at - time.time())
 
-                    print(f'Login realizado com sucesso. Token válido até: {self._validade_token}')
+                    logger.info('Login realizado com sucesso. Token válido até: %s', self._validade_token)
                     return True
                 else:
-                    print('Token oAuthToken não encontrado nos cookies')
+                    logger.error('Token oAuthToken não encontrado nos cookies')
                     return False
             else:
-                print(f'Falha no login. Status Code: {response.status_code}')
-                print(f'Response: {response.text}')
+                logger.error('Falha no login. Status Code: %s', response.status_code)
+                logger.error('Response: %s', response.text)
                 return False
 
         except Exception as e:
-            print(f'Erro durante o login: {str(e)}')
+            logger.error('Erro durante o login: %s', e)
             return False
 
     def _token_precisa_renovar(self) -> bool:
@@ -167,14 +217,7 @@ class GerenciadorToken:
         Returns:
             bool: True se o token precisa ser renovado, False caso contrário
         """
-        if self._validade_token is None or self._token_data is None:
-            return True
-
-        # Verifica se faltam menos de 10 minutos para expirar
-        agora = datetime.now()
-        margem_seguranca = timedelta(minutes=10)
-
-        return (self._validade_token - agora) <= margem_seguranca
+        return not self._token_e_valido()
 
     def _token_e_valido(self) -> bool:
         """
@@ -183,13 +226,19 @@ class GerenciadorToken:
         Returns:
             bool: True se o token é válido, False caso contrário
         """
-        if self._validade_token is None or self._token_data is None:
-            return False
+        # _expires_at_mono já desconta a margem de segurança e vale 0.0 enquanto não há token
+        return time.monotonic() < self._expires_at_mono
 
-        agora = datetime.now()
-        margem_seguranca = timedelta(minutes=10)
+    def _cached_token(self) -> Optional[Dict]:
+        """
+        Retorna o token em memória se ainda for válido, sem lock nem renovação (fast path).
 
-        return (self._validade_token - agora) > margem_seguranca
+        Returns:
+            Dict: Dados do token se válido, None caso contrário
+        """
+        if time.monotonic() < self._expires_at_mono:
+            return self._token_data
+        return None
 
     def carregar_token_salvo(self) -> bool:
         """
@@ -202,75 +251,81 @@ class GerenciadorToken:
             if not os.path.exists(self.arquivo_cookies):
                 return False
 
-            with open(self.arquivo_cookies, 'r', encoding='utf-8') as f:
-                cookies_dict = json.load(f)
+            # Arquivo não mudou desde a última leitura/gravação: o token em memória já é o dele
+            mtime = os.path.getmtime(self.arquivo_cookies)
+            if mtime == self._cookies_mtime and self._token_data is not None:
+                return self._token_e_valido()
+
+            with open(self.arquivo_cookies, 'rb') as f:
+                cookies_dict = orjson.loads(f.read())
 
             if 'oAuthToken' not in cookies_dict:
                 return False
 
-            self._token_data = json.loads(cookies_dict['oAuthToken'])
+            self._token_data = orjson.loads(cookies_dict['oAuthToken'])
+            self._auth_header = f"Bearer {self._token_data['access_token']}"
 
             # fuso horario UTC
-            self._validade_token = datetime.strptime(
-                self._token_data['.expires'],
-                '%Y-%m-%dT%H:%M:%SZ'
-            )
+            validade_utc = datetime.fromisoformat(self._token_data['.expires'].rstrip('Z'))
+            self._expires_at = calendar.timegm(validade_utc.utctimetuple()) - MARGEM_RENOVACAO_SEGUNDOS
+            self._expires_at_mono = time.monotonic() + (self._expires_at - time.time())
             # compensar fuso horario local se necessário
-            self._validade_token = self._validade_token + timedelta(hours=-3)
+            self._validade_token = validade_utc + timedelta(hours=-3)
+            self._cookies_mtime = mtime
 
-            # Recriar cookies na sessão
+            # Recriar cookies no cliente
             for name, value in cookies_dict.items():
-                self.session.cookies.set(name, value)
+                self.client.cookies.set(name, value)
 
             if not self._token_precisa_renovar():
-                print(f'Token carregado do arquivo. Válido até: {self._validade_token}')
+                logger.info('Token carregado do arquivo. Válido até: %s', self._validade_token)
                 return True
             else:
-                print('Token salvo está próximo do vencimento ou expirado')
+                logger.info('Token salvo está próximo do vencimento ou expirado')
                 return False
 
         except Exception as e:
-            print(f'Erro ao carregar token salvo: {str(e)}')
+            logger.warning('Erro ao carregar token salvo: %s', e)
             return False
 
-    def pegar_token_atualizado(self) -> Optional[Dict]:
+    async def pegar_token_atualizado(self) -> Optional[Dict]:
         """
         Retorna um token válido, renovando-o se necessário.
-        Thread-safe: múltiplas requisições simultâneas usarão o mesmo token.
+        Múltiplas requisições simultâneas usarão o mesmo token; apenas uma faz a renovação.
 
         Returns:
             Dict: Dados do token se válido, None caso contrário
         """
         # Primeiro verifica se já tem um token válido sem lock (fast path)
-        if self._token_e_valido():
-            print(f'Token atual ainda é válido até: {self._validade_token}')
-            return self._token_data
+        token = self._cached_token()
+        if token is not None:
+            return token
 
-        # Se precisar renovar ou carregar, usa lock para garantir que apenas uma thread faça isso
-        with self._lock:
-            # Double-check: outra thread pode ter renovado enquanto esperávamos o lock
+        # Se precisar renovar ou carregar, usa lock para garantir que apenas uma corrotina faça isso
+        async with self._lock:
+            # Double-check: outra corrotina pode ter renovado enquanto esperávamos o lock
             if self._token_e_valido():
-                print(f'Token foi renovado por outra requisição. Válido até: {self._validade_token}')
+                logger.debug('Token foi renovado por outra requisição. Válido até: %s', self._validade_token)
                 return self._token_data
 
-            # Primeiro tenta carregar token salvo se não há token em memória
-            if self._token_data is None:
-                self.carregar_token_salvo()
+            # Primeiro tenta carregar o token salvo, que pode ter sido renovado por outro worker;
+            # o arquivo só é relido se mudou desde a última leitura/gravação
+            self.carregar_token_salvo()
 
             # Verifica novamente se o token atual já é válido após carregar
             if self._token_e_valido():
-                print(f'Token carregado é válido até: {self._validade_token}')
+                logger.debug('Token carregado é válido até: %s', self._validade_token)
                 return self._token_data
 
             # Se chegou aqui, o token precisa ser renovado
             if self._token_precisa_renovar():
-                print('Token expirado ou próximo do vencimento. Renovando...')
-                if not self._fazer_login():
+                logger.info('Token expirado ou próximo do vencimento. Renovando...')
+                if not await self._fazer_login():
                     return None
 
             return self._token_data
 
-    def requisicao_get(self, url: str, params: Dict = None) -> Optional[requests.Response]:
+    async def requisicao_get(self, url: str, params: Dict = None) -> Optional[httpx.Response]:
         """
         Realiza uma requisição GET autenticada.
 
@@ -279,27 +334,22 @@ class GerenciadorToken:
             params: Parâmetros da requisição
 
         Returns:
-            requests.Response: Resposta da requisição se bem-sucedida, None caso contrário
+            httpx.Response: Resposta da requisição se bem-sucedida, None caso contrário
         """
-        session = self.obter_session_autenticada()
-        if session is None:
-            print('Sessão não autenticada. Não é possível fazer a requisição GET.')
+        client, auth_header = await self._session_and_token()
+        if client is None:
+            logger.warning('Sessão não autenticada. Não é possível fazer a requisição GET.')
             return None
 
-        cabecalhos = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.pegar_token_atualizado()["access_token"]}'
-        }
-
-        response = session.get(url, params=params, verify=False, headers=cabecalhos)
+        response = await client.get(url, params=params, headers={'Authorization': auth_header})
 
         if response.status_code == 200:
             return response
         else:
-            print(f'Erro na requisição GET: {response.status_code}')
+            logger.warning('Erro na requisição GET: %s', response.status_code)
             return None
 
-    def requisicao_post(self, url: str, json: Dict = None, data: Dict = None) -> Optional[requests.Response]:
+    async def requisicao_post(self, url: str, json: Dict = None, data: Dict = None) -> Optional[httpx.Response]:
         """
         Realiza uma requisição POST autenticada.
 
@@ -308,36 +358,42 @@ class GerenciadorToken:
             data: Dados da requisição
 
         Returns:
-            requests.Response: Resposta da requisição se bem-sucedida, None caso contrário
+            httpx.Response: Resposta da requisição se bem-sucedida, None caso contrário
         """
-        cabecalhos = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.pegar_token_atualizado()["access_token"]}'
-        }
-
-        session = self.obter_session_autenticada()
-        if session is None:
-            print('Sessão não autenticada. Não é possível fazer a requisição POST.')
+        client, auth_header = await self._session_and_token()
+        if client is None:
+            logger.warning('Sessão não autenticada. Não é possível fazer a requisição POST.')
             return None
 
-        response = session.post(url, json=json, data=data, verify=False, headers=cabecalhos)
+        response = await client.post(url, json=json, data=data, headers={'Authorization': auth_header})
 
         if response.status_code == 200:
             return response
         else:
-            print(f'Erro na requisição POST: {response.status_code}')
+            logger.warning('Erro na requisição POST: %s', response.status_code)
             return None
 
+    async def _session_and_token(self) -> Tuple[Optional[httpx.AsyncClient], Optional[str]]:
+        """
+        Retorna o cliente HTTP e o cabeçalho de autorização, verificando o token uma única vez.
+
+        Returns:
+            Tuple: (cliente, 'Bearer ...') se o token é válido, (None, None) caso contrário
+        """
+        # Fast path sem criar a corrotina de pegar_token_atualizado quando o token ainda é válido
+        if self._cached_token() is None and await self.pegar_token_atualizado() is None:
+            return None, None
+        return self.client, self._auth_header
 
-    def obter_session_autenticada(self) -> Optional[requests.Session]:
+    async def obter_session_autenticada(self) -> Optional[httpx.AsyncClient]:
         """
-        Retorna uma sessão com cookies de autenticação válidos.
+        Retorna o cliente HTTP com cookies de autenticação válidos.
 
         Returns:
-            requests.Session: Sessão autenticada se válida, None caso contrário
+            httpx.AsyncClient: Cliente autenticado se válido, None caso contrário
         """
-        if self.pegar_token_atualizado() is not None:
-            return self.session
+        if await self.pegar_token_atualizado() is not None:
+            return self.client
         return None
 
     def tempo_restante_token(self) -> Optional[timedelta]:
@@ -350,10 +406,9 @@ class GerenciadorToken:
         if self._validade_token is None:
             return None
 
-        agora = datetime.now()
-        tempo_restante = self._validade_token - agora
+        segundos_restantes = self._expires_at + MARGEM_RENOVACAO_SEGUNDOS - time.time()
 
-        return tempo_restante if tempo_restante.total_seconds() > 0 else timedelta(0)
+        return timedelta(seconds=segundos_restantes) if segundos_restantes > 0 else timedelta(0)
 
     def status_token(self) -> Dict:
         """
@@ -372,7 +427,7 @@ class GerenciadorToken:
             'precisa_renovar': self._token_precisa_renovar()
         }
 
-    def ativar_categoria(self, codigo_categoria: str) -> bool:
+    async def ativar_categoria(self, codigo_categoria: str) -> bool:
         """
         Ativa uma categoria específica usando a API.
 
@@ -382,19 +437,19 @@ class GerenciadorToken:
         Returns:
             bool: True se a categoria foi ativada com sucesso, False caso contrário
         """
-        session = self.obter_session_autenticada()
-        if session is None:
-            print('Sessão não autenticada. Não é possível ativar a categoria.')
+        client, auth_header = await self._session_and_token()
+        if client is None:
+            logger.warning('Sessão não autenticada. Não é possível ativar a categoria.')
             return False
 
         url_ativar = self.cadastros_estruturais_ativar_categoria.replace(':codigo_categoria', codigo_categoria)
 
-        response = session.post(url_ativar, verify=False)
+        response = await client.post(url_ativar, headers={'Authorization': auth_header})
 
         if response.status_code == 200:
-            print(f'Categoria {codigo_categoria} ativada com sucesso.')
+            logger.info('Categoria %s ativada com sucesso.', codigo_categoria)
             return True
         else:
-            print(f'Falha ao ativar categoria {codigo_categoria}. Status Code: {response.status_code}')
+            logger.warning('Falha ao ativar categoria %s. Status Code: %s', codigo_categoria, response.status_code)
             return False
 
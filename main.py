@@ -1,23 +1,41 @@
 from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, ORJSONResponse, Response
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from pydantic import BaseModel
 from typing import Optional, Any, List, Dict
+from contextlib import asynccontextmanager
 import os
 import secrets
+import hashlib
 from gerenciar_token import GerenciadorToken
 import uvicorn
-import urllib3
 from enum import Enum
 
-urllib3.disable_warnings()
 
+# Ciclo de vida da aplicação
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Cria os gerenciadores de todos os ambientes e aquece seus tokens antes de
+    aceitar requisições; fecha os clientes HTTP ao encerrar a aplicação.
+    """
+    for ambiente in AmbientesEnum:
+        gerenciador = criar_gerenciador(ambiente)
+        await gerenciador.pegar_token_atualizado()
+        gerenciadores_cache[ambiente] = gerenciador
+
+    yield
+
+    for gerenciador in gerenciadores_cache.values():
+        await gerenciador.aclose()
 
 # Configuração da API
 app = FastAPI(
     title="API SQL Consinco",
     description="API para executar consultas SQL via GerenciadorToken",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Modelo de requisição
@@ -30,12 +48,26 @@ class SQLResponse(BaseModel):
     data: Optional[Any] = None  # Alterado de dict para Any para aceitar lista ou dict
     error: Optional[str] = None
 
-# Configurações do gerenciador (pode ser movido para variáveis de ambiente)
-NOME = os.getenv('NOME')
-SENHA = os.getenv('SENHA')
-PORT= os.getenv('PORT', 8001)
-URL_PROD = os.getenv('URL_LOGIN_PROD', '')
-URL_DEV = os.getenv('URL_LOGIN_DEV', '')
+# Leitura das variáveis de ambiente obrigatórias
+def _require_env(*nomes: str) -> Dict[str, str]:
+    """
+    Lê de uma só vez as variáveis de ambiente obrigatórias.
+    Levanta RuntimeError se alguma delas não estiver definida.
+    """
+    env = os.environ
+    faltando = [nome for nome in nomes if nome not in env]
+    if faltando:
+        raise RuntimeError(f"{', '.join(faltando)} não está definido nas variáveis de ambiente")
+    return {nome: env[nome] for nome in nomes}
+
+cfg = _require_env('NOME', 'SENHA', 'URL_LOGIN_PROD', 'URL_LOGIN_DEV', 'VALID_USERNAME', 'VALID_PASSWORD')
+
+# Configurações do gerenciador
+NOME = cfg['NOME']
+SENHA = cfg['SENHA']
+PORT = int(os.environ.get('PORT', 8001))
+URL_PROD = cfg['URL_LOGIN_PROD']
+URL_DEV = cfg['URL_LOGIN_DEV']
 
 
 print('NOME: ' + NOME)
@@ -50,50 +82,49 @@ class AmbientesEnum(str, Enum):
 AMBIENTES_CONFIG = {
     AmbientesEnum.PROD: {
         "url": URL_PROD,
-        "nome": os.getenv('NOME'),
-        "senha": os.getenv('SENHA')
+        "nome": NOME,
+        "senha": SENHA
     },
     AmbientesEnum.DEV: {
         "url": URL_DEV,
-        "nome": os.getenv('NOME'),
-        "senha": os.getenv('SENHA')
+        "nome": NOME,
+        "senha": SENHA
     }
 }
 
-# Cache para instâncias do GerenciadorToken
+# Instâncias do GerenciadorToken, preenchidas no lifespan da aplicação
 gerenciadores_cache: Dict[AmbientesEnum, GerenciadorToken] = {}
 
-# Validações das variáveis de ambiente
-assert NOME is not None, "NOME não está definido nas variáveis de ambiente"
-assert SENHA is not None, "SENHA não está definido nas variáveis de ambiente"
-assert AMBIENTES_CONFIG[AmbientesEnum.PROD]["url"] is not None, "URL_LOGIN_PROD não está definido nas variáveis de ambiente"
-assert AMBIENTES_CONFIG[AmbientesEnum.DEV]["url"] is not None, "URL_LOGIN_DEV não está definido nas variáveis de ambiente"
-
 # Configuração de autenticação Basic
 security = HTTPBasic()
 
 # Credenciais válidas
-VALID_USERNAME = os.getenv('VALID_USERNAME')
-VALID_PASSWORD = os.getenv('VALID_PASSWORD')
+VALID_USERNAME = cfg['VALID_USERNAME']
+VALID_PASSWORD = cfg['VALID_PASSWORD']
+
+# Digests SHA-256 das credenciais válidas, para comparação em tempo constante
+_VALID_USER_HASH = hashlib.sha256(VALID_USERNAME.encode()).digest()
+_VALID_PASS_HASH = hashlib.sha256(VALID_PASSWORD.encode()).digest()
 
-assert VALID_USERNAME is not None, "VALID_USERNAME não está definido nas variáveis de ambiente"
-assert VALID_PASSWORD is not None, "VALID_PASSWORD não está definido nas variáveis de ambiente"
 
+# Função para criar o gerenciador de um ambiente
+def criar_gerenciador(ambiente: AmbientesEnum) -> GerenciadorToken:
+    """
+    Cria uma instância do GerenciadorToken para o ambiente especificado.
+    """
+    config = AMBIENTES_CONFIG[ambiente]
+    return GerenciadorToken(
+        url_login=config["url"],
+        nome=int(config["nome"]),
+        senha=int(config["senha"])
+    )
 
 # Função para obter gerenciador baseado no ambiente
 def obter_gerenciador(ambiente: AmbientesEnum) -> GerenciadorToken:
     """
-    Obtém uma instância do GerenciadorToken para o ambiente especificado.
-    Usa cache para evitar múltiplas inicializações.
+    Obtém a instância do GerenciadorToken para o ambiente especificado.
+    As instâncias são criadas uma única vez, na inicialização da aplicação.
     """
-    if ambiente not in gerenciadores_cache:
-        config = AMBIENTES_CONFIG[ambiente]
-        gerenciadores_cache[ambiente] = GerenciadorToken(
-            url_login=config["url"],
-            nome=int(config["nome"]),
-            senha=int(config["senha"])
-        )
-
     return gerenciadores_cache[ambiente]
 
 # Dependência de autenticação
@@ -101,11 +132,16 @@ def verificar_autenticacao(credentials: HTTPBasicCredentials = Depends(security)
     """
     Verifica se as credenciais Basic Auth são válidas.
     """
-    # Comparação segura para evitar timing attacks
-    correct_username = secrets.compare_digest(credentials.username, VALID_USERNAME)
-    correct_password = secrets.compare_digest(credentials.password, VALID_PASSWORD)
-
-    if not (correct_username and correct_password):
+    # Comparação segura para evitar timing attacks: os digests têm tamanho fixo, então
+    # o tempo não revela o tamanho das credenciais, e o '&' sempre executa as duas comparações
+    username_hash = hashlib.sha256(credentials.username.encode()).digest()
+    password_hash = hashlib.sha256(credentials.password.encode()).digest()
+    credenciais_validas = (
+        secrets.compare_digest(username_hash, _VALID_USER_HASH)
+        & secrets.compare_digest(password_hash, _VALID_PASS_HASH)
+    )
+
+    if not credenciais_validas:
         raise HTTPException(
             status_code=401,
             detail="Credenciais inválidas",
@@ -121,8 +157,9 @@ def health_check(username: str = Depends(verificar_autenticacao)):
     return {"status": "ok", "message": "API está funcionando"}
 
 # Endpoint principal para executar SQL
-@app.post("/sql/query", response_model=SQLResponse)
-def executar_sql(
+# Sem response_model: o resultado não é validado pelo pydantic, SQLResponse serve apenas para a documentação
+@app.post("/sql/query", responses={200: {"model": SQLResponse}})
+async def executar_sql(
     ambiente: AmbientesEnum,
     query: SQLQuery,
     username: str = Depends(verificar_autenticacao)
@@ -148,20 +185,20 @@ def executar_sql(
         gerenciador = obter_gerenciador(ambiente)
 
         # Executar consulta SQL
-        resultado = gerenciador.consulta_sql(query.sql_query)
+        resultado = await gerenciador.consulta_sql_bruta(query.sql_query)
 
         if resultado is not None:
-            return SQLResponse(
-                success=True,
-                data=resultado,
-                error=None
+            # Repassa o JSON da API sem decodificar e recodificar o resultado
+            return Response(
+                content=b'{"success":true,"data":' + (resultado or b'null') + b',"error":null}',
+                media_type="application/json"
             )
         else:
-            return SQLResponse(
-                success=False,
-                data=None,
-                error="Falha ao executar a consulta SQL"
-            )
+            return {
+                "success": False,
+                "data": None,
+                "error": "Falha ao executar a consulta SQL"
+            }
 
     except Exception as e:
         raise HTTPException(
@@ -171,7 +208,7 @@ def executar_sql(
 
 # Endpoint para verificar status do token
 @app.get("/token/status")
-def status_token(
+async def status_token(
     ambiente: AmbientesEnum,
     username: str = Depends(verificar_autenticacao)
 ):
@@ -207,5 +244,13 @@ def root(username: str = Depends(verificar_autenticacao)):
 
 # Executar servidor
 if __name__ == "__main__":
-    # Para desenvolvimento
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    # Um processo por núcleo (ou WEB_CONCURRENCY); "auto" usa uvloop e httptools quando instalados
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=PORT,
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count())),
+        loop="auto",
+        http="auto",
+        access_log=False
+    )